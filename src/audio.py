@@ -1,38 +1,272 @@
 import pygame
 from gtts import gTTS
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+import hashlib
+import io
 import os
+import queue
+import threading
 import time
 
+# --- TTS CACHE SETTINGS ---
+CACHE_DIR = os.path.expanduser("~/.cache/chuds_tts")
+CACHE_MAX_FILES = 200  # Oldest-accessed clips get evicted past this
+SPEECH_QUEUE_SIZE = 4  # Roasts waiting to be synthesized / played
+PRECACHE_WORKERS = 4   # Parallel gTTS requests while pre-caching
+GTTS_TIMEOUT = 10.0    # Seconds before a stalled gTTS request gives up
+SHUTDOWN_TIMEOUT = 2.0 # Longest close() waits for each background thread
+
+# --- MIXER SETTINGS ---
+# gTTS returns 24 kHz mono MP3. Opening the mixer in the same format lets
+# pygame decode straight to the output with no resample or stereo upmix.
+MIXER_FREQUENCY = 24000
+MIXER_CHANNELS = 1
+PLAYBACK_GRACE = 1.0  # Seconds a clip may run past its length before it counts as stuck
+
 class Speaker:
     """
     Text-to-speech speaker using gTTS and pygame.
+
+    Synthesized clips are cached on disk keyed by (text, lang, tld), so a
+    roast that has been said before never goes back out to the network.
+
+    Synthesis and playback run on two background threads, so the next
+    roast is fetched from gTTS while the current one is still playing.
     """
-    def __init__(self):
-        """Initialize the speaker (pygame mixer will be initialized on first use)."""
-        self.temp_file = "temp_roast_audio.mp3"
-        pygame.mixer.init()
-    
+    _mixer_lock = threading.Lock()
+
+    def __init__(self, lang='en', tld='co.in'):
+        """Initialize the speaker and start its threads (the play thread opens the pygame mixer right away)."""
+        self.lang = lang
+        self.tld = tld  # 'co.in' = Indian accent
+        self.cache_dir = CACHE_DIR
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Clip bytes already loaded this session, so playback never touches disk
+        self._clips = {}  # cache path -> MP3 bytes
+        self._clips_lock = threading.Lock()  # Pre-cache workers and the synth thread share it
+
+        # Syntheses currently running, so identical requests share one gTTS call
+        self._inflight = {}  # cache path -> Future
+        self._inflight_lock = threading.Lock()
+
+        # Producer/consumer pipeline: text -> synth thread -> clip bytes -> play thread
+        self._synth_q = queue.Queue(maxsize=SPEECH_QUEUE_SIZE)
+        self._play_q = queue.Queue(maxsize=SPEECH_QUEUE_SIZE)
+        self._stop_event = threading.Event()
+        self._synth_thread = threading.Thread(target=self._synth_worker, daemon=True)
+        self._play_thread = threading.Thread(target=self._play_worker, daemon=True)
+        self._synth_thread.start()
+        self._play_thread.start()
+
+    @classmethod
+    def _init_mixer(cls):
+        """Open the audio device once per process (ALSA probing is slow on the Pi)."""
+        with cls._mixer_lock:
+            if pygame.mixer.get_init():
+                return
+            pygame.mixer.init(frequency=MIXER_FREQUENCY, size=-16, channels=MIXER_CHANNELS)
+
+    def _cache_path(self, text):
+        """Return the cache file path for a piece of text."""
+        key = hashlib.sha1(f"{self.lang}|{self.tld}|{text}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, key + ".mp3")
+
+    def _synthesize(self, text):
+        """
+        Make sure the audio for text is in the cache and return its MP3 bytes.
+        Only calls gTTS on a cache miss.
+        """
+        path = self._cache_path(text)
+        with self._clips_lock:
+            clip = self._clips.get(path)
+        if clip is not None:
+            return clip
+
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                clip = f.read()
+            self._remember(path, clip)
+            return clip
+
+        # If another thread is already generating this clip, wait for it
+        with self._inflight_lock:
+            future = self._inflight.get(path)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._inflight[path] = future
+        if not is_owner:
+            return future.result()
+
+        try:
+            print(f"Generating audio: '{text[:50]}...'")
+            tts = gTTS(text=text, lang=self.lang, tld=self.tld, timeout=GTTS_TIMEOUT)
+            buf = io.BytesIO()
+            tts.write_to_fp(buf)
+            clip = buf.getvalue()
+
+            tmp_path = f"{path}.{threading.get_ident()}.part"
+            with open(tmp_path, 'wb') as f:
+                f.write(clip)
+            os.replace(tmp_path, path)  # Never leave a half-written clip in the cache
+            self._remember(path, clip)
+            future.set_result(clip)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[path]
+
+        self._evict_old_files()
+        return clip
+
+    def _remember(self, path, clip):
+        """Keep a clip in memory, dropping the oldest past CACHE_MAX_FILES."""
+        with self._clips_lock:
+            self._clips[path] = clip
+            if len(self._clips) > CACHE_MAX_FILES:
+                self._clips.pop(next(iter(self._clips)))
+
+    def _evict_old_files(self):
+        """Drop the least recently used clips once the cache grows past CACHE_MAX_FILES."""
+        try:
+            files = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir) if f.endswith(".mp3")]
+            if len(files) <= CACHE_MAX_FILES:
+                return
+            files.sort(key=os.path.getatime)
+            for path in files[:len(files) - CACHE_MAX_FILES]:
+                os.remove(path)
+        except OSError as e:
+            print(f"Cache eviction warning: {e}")
+
+    def precache(self, roaster):
+        """
+        Synthesize every roast the RoastMaster can produce so speak()
+        never has to wait on gTTS at runtime.
+
+        Args:
+            roaster (RoastMaster): The roaster whose catalog to cache
+        """
+        roasts = roaster.all_roasts()
+        missing = [text for text in roasts if not os.path.exists(self._cache_path(text))]
+        print(f"Pre-caching {len(roasts)} roasts ({len(missing)} to generate)...")
+
+        # gTTS is network-bound, so a few parallel requests fill the cache much faster.
+        # Clips already on disk are just loaded into memory.
+        failed, last_error = 0, None
+        with ThreadPoolExecutor(max_workers=PRECACHE_WORKERS) as pool:
+            futures = [pool.submit(self._synthesize, text) for text in roasts]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    failed, last_error = failed + 1, e
+
+        if failed:
+            print(f"Pre-cache ERROR: {failed} roasts failed ({last_error})")
+        else:
+            print("Pre-cache complete.")
+
     def speak(self, text):
         """
-        Generate audio from text and play it.
+        Queue text to be spoken and return immediately.
         
         Args:
             text (str): The text to speak
         """
         try:
-            # Generate the audio file
-            print(f"Generating audio: '{text[:50]}...'")
-            tts = gTTS(text=text, lang='en', tld='co.in')  # Indian accent
-            tts.save(self.temp_file)
-            
-            # Play the audio
-            pygame.mixer.music.load(self.temp_file)
-            pygame.mixer.music.play()
-            
-            # Wait for playback to finish
-            while pygame.mixer.music.get_busy():
-                time.sleep(0.1)
-            
+            self._synth_q.put_nowait((text, None))
+        except queue.Full:
+            print(f"Speaker busy, dropping: '{text[:50]}...'")
+
+    def speak_and_wait(self, text):
+        """
+        Speak text and block until playback has finished.
+        
+        Args:
+            text (str): The text to speak
+        """
+        done = threading.Event()
+        if not self._put_until_stopped(self._synth_q, (text, done)):
+            return
+        # Give up if the speaker is closed before the clip gets played
+        while not done.wait(0.5):
+            if self._stop_event.is_set():
+                return
+
+    def _put_until_stopped(self, q, item):
+        """Put item on q, giving up once the speaker is stopping. Returns whether it was queued."""
+        while not self._stop_event.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _synth_worker(self):
+        """Background thread: turns queued text into audio clips."""
+        while not self._stop_event.is_set():
+            try:
+                text, done = self._synth_q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            try:
+                clip = self._synthesize(text)
+            except Exception as e:
+                print(f"Speaker ERROR: {e}")
+                if done is not None:
+                    done.set()
+                continue
+
+            # The play thread may already have stopped, so don't block on a full queue
+            if not self._put_until_stopped(self._play_q, (clip, done)):
+                break
+
+    def _play_worker(self):
+        """Background thread: plays clips one after another."""
+        # Open the audio device now, off the main thread, so the first roast
+        # doesn't pay for it. It then stays open for the life of the process.
+        try:
+            self._init_mixer()
+        except Exception as e:
+            print(f"Speaker ERROR: Could not open audio device: {e}")
+
+        while not self._stop_event.is_set():
+            try:
+                clip, done = self._play_q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            self._play(clip)
+            if done is not None:
+                done.set()
+
+    def _play(self, clip):
+        """Play a single MP3 clip from memory and wait for it to finish."""
+        channel = None
+        try:
+            self._init_mixer()
+            sound = pygame.mixer.Sound(io.BytesIO(clip))
+            channel = sound.play()
+            if channel is None:
+                raise RuntimeError("no free mixer channel")
+
+            # Sleep for the clip's length instead of polling get_busy(). Waiting on
+            # the stop event lets close() cut a clip short.
+            if self._stop_event.wait(sound.get_length()):
+                return
+
+            # Let the device drain its last buffer, but don't hang on a stuck clip
+            deadline = time.monotonic() + PLAYBACK_GRACE
+            while channel.get_busy():
+                if time.monotonic() > deadline:
+                    raise TimeoutError("clip did not finish playing")
+                time.sleep(0.01)
+
             print("Audio playback finished.")
             
         except Exception as e:
@@ -40,27 +274,30 @@ class Speaker:
         
         finally:
             # Clean up
-            self._cleanup()
+            self._cleanup(channel)
     
-    def _cleanup(self):
-        """Clean up temporary audio file."""
+    def _cleanup(self, channel):
+        """Stop playback on the clip's channel (the cached file is kept)."""
         try:
-            if pygame.mixer.get_init():
-                pygame.mixer.music.stop()
-                if hasattr(pygame.mixer.music, 'unload'):
-                    pygame.mixer.music.unload()
-            
-            # Remove temp file
-            if os.path.exists(self.temp_file):
-                time.sleep(0.2)  # Give a moment for file to be released
-                os.remove(self.temp_file)
+            if channel is not None and pygame.mixer.get_init():
+                channel.stop()
         except Exception as e:
             print(f"Cleanup warning: {e}")
     
+    def close(self):
+        """Stop the background synth/playback threads."""
+        self._stop_event.set()
+        # A gTTS request can outlast the timeout; the threads are daemons, so
+        # one still running won't keep the process alive
+        for thread in (self._synth_thread, self._play_thread):
+            thread.join(timeout=SHUTDOWN_TIMEOUT)
+            if thread.is_alive():
+                print(f"Speaker warning: {thread.name} did not stop in time")
+
     def __del__(self):
-        """Cleanup on object destruction."""
+        """Cleanup on object destruction (the shared mixer is left open)."""
         try:
-            pygame.mixer.quit()
+            self._stop_event.set()
         except:
             pass
 
@@ -84,42 +321,42 @@ def test_audio_pipeline():
         print("1. Testing ANGRY roast:")
         text_to_say = roaster.get_roast(emotion_key='angry', player_id='left') 
         print(f"   Roast: {text_to_say}")
-        speaker.speak(text_to_say)
+        speaker.speak_and_wait(text_to_say)
         time.sleep(1)
 
         # Test sad roast
         print("\n2. Testing SAD roast:")
         text_to_say = roaster.get_roast(emotion_key='sad', player_id='left')
         print(f"   Roast: {text_to_say}")
-        speaker.speak(text_to_say)
+        speaker.speak_and_wait(text_to_say)
         time.sleep(1)
 
         # Test shake roast
         print("\n2. Testing SHAKE roast:")
         text_to_say = roaster.get_roast(emotion_key='shake', player_id='right')
         print(f"   Roast: {text_to_say}")
-        speaker.speak(text_to_say)
+        speaker.speak_and_wait(text_to_say)
         time.sleep(1)
 
         # Test yell roast
         print("\n2. Testing YELL roast:")
         text_to_say = roaster.get_roast(emotion_key='yell', player_id='left')
         print(f"   Roast: {text_to_say}")
-        speaker.speak(text_to_say)
+        speaker.speak_and_wait(text_to_say)
         time.sleep(1)
         
         # Test neutral roast
         print("\n3. Testing NEUTRAL roast:")
         text_to_say = roaster.get_roast(emotion_key='neutral', player_id='right')
         print(f"   Roast: {text_to_say}")
-        speaker.speak(text_to_say)
+        speaker.speak_and_wait(text_to_say)
         
     except Exception as e:
         print(f"Could not import RoastMaster: {e}")
         print("Testing with fallback text...")
         text_to_say = "This is a short test audio to verify playback and cleanup."
         speaker = Speaker()
-        speaker.speak(text_to_say)
+        speaker.speak_and_wait(text_to_say)
     
     print("\n--- AUDIO TEST COMPLETE ---")
 
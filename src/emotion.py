@@ -0,0 +1,273 @@
+import os
+
+import cv2
+import numpy as np
+
+# DeepFace (and with it TensorFlow, seconds to import on the Pi) is only imported
+# when the Keras model or a DeepFace detector is actually used.
+
+# onnxruntime is optional: without it we fall back to DeepFace's Keras model
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+# --- MODEL SETTINGS ---
+EMOTION_LABELS = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+FACE_SIZE = 48  # The emotion CNN takes 48x48 grayscale faces
+HAAR_CASCADE_PATH = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+# Players sit close to the camera, so the cascade can take coarse scale steps
+# and skip the small scales entirely (sizes are in analysis-frame pixels)
+MIN_FACE_SIZE = (60, 60)
+DETECT_SCALE_FACTOR = 1.3
+MAX_BATCH = 2  # One face per player; the input buffer grows if more show up
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+ONNX_MODEL_PATH = os.path.join(MODEL_DIR, "emotion_int8.onnx")  # Built by export_emotion_model.py
+FP32_MODEL_PATH = os.path.join(MODEL_DIR, "emotion_fp32.onnx")
+# OpenCV Zoo's YuNet face detector, used for the 'yunet' backend when downloaded to MODEL_DIR
+YUNET_MODEL_PATH = os.path.join(MODEL_DIR, "face_detection_yunet_2023mar.onnx")
+
+# On a machine with an NVIDIA GPU, run the FP32 export through TensorRT in FP16.
+# The built engine is cached in MODEL_DIR so only the first run pays for the build.
+GPU_PROVIDERS = [
+    ('TensorrtExecutionProvider', {
+        'trt_fp16_enable': True,
+        'trt_engine_cache_enable': True,
+        'trt_engine_cache_path': MODEL_DIR,
+    }),
+    'CUDAExecutionProvider',
+]
+# XNNPACK has NEON kernels for the int8 model's ops on the Pi's Arm cores
+CPU_PROVIDERS = ['XnnpackExecutionProvider', 'CPUExecutionProvider']
+
+
+def load_keras_emotion_model():
+    """
+    Loads DeepFace's Keras emotion model.
+    (build_model's signature changed between DeepFace versions.)
+    """
+    from deepface import DeepFace
+
+    try:
+        model = DeepFace.build_model(model_name="Emotion", task="facial_attribute")
+    except TypeError:
+        model = DeepFace.build_model("Emotion")
+
+    # Newer DeepFace versions wrap the Keras model in a client object
+    return getattr(model, "model", model)
+
+
+def limit_tensorflow_threads(num_threads):
+    """
+    Caps TensorFlow's thread pools. Only works before TensorFlow has run
+    anything, so a too-late call is reported and ignored.
+    """
+    import tensorflow as tf
+
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except RuntimeError as e:
+        print(f"Emotion: Could not limit TensorFlow threads: {e}")
+
+
+def preprocess_face(face, out=None):
+    """
+    Turns a face crop into the emotion model's input.
+
+    Args:
+        face (np.ndarray): Grayscale or BGR uint8 face crop
+        out (np.ndarray): Optional (48, 48, 1) float32 array to write into
+    Returns:
+        np.ndarray: (48, 48, 1) float32 image scaled to [0, 1]
+    """
+    if out is None:
+        out = np.empty((FACE_SIZE, FACE_SIZE, 1), dtype=np.float32)
+
+    # Shrink first, so a colour crop is only converted at 48x48
+    gray = cv2.resize(face, (FACE_SIZE, FACE_SIZE), interpolation=cv2.INTER_AREA)
+    if gray.ndim == 3:
+        gray = cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY)
+    np.multiply(gray, 1.0 / 255.0, out=out[:, :, 0], dtype=np.float32)
+    return out
+
+
+class EmotionAnalyzer:
+    """
+    Finds faces in a frame and classifies their emotion.
+
+    Faces are found with OpenCV's Haar cascade directly for the 'opencv'
+    backend and with OpenCV's YuNet CNN for 'yunet' when its model is in
+    MODEL_DIR (skipping DeepFace's per-face alignment and resizing), or with
+    DeepFace's detector for any other backend. The emotion step runs the
+    exported ONNX model through ONNX Runtime when it has been exported and
+    onnxruntime is installed (FP16 TensorRT/CUDA on an NVIDIA GPU, int8 on
+    the CPU), otherwise DeepFace's Keras model.
+    """
+    def __init__(self, detector_backend='opencv', num_threads=None):
+        """
+        Args:
+            detector_backend (str): 'opencv' for the Haar cascade, 'yunet', or any DeepFace backend
+            num_threads (int): Threads the emotion model may use (None = library default)
+        """
+        self.detector_backend = detector_backend
+        self.face_cascade = None
+        self.face_yunet = None
+        self.use_opencl = False
+        if detector_backend == 'yunet' and os.path.exists(YUNET_MODEL_PATH):
+            # Input size is set per frame in detect()
+            self.face_yunet = cv2.FaceDetectorYN.create(YUNET_MODEL_PATH, "", (0, 0))
+            self._yunet_bgr = None  # Reused 3-channel copy of the grayscale frame
+            print("Emotion: Using YuNet face detector.")
+        elif detector_backend == 'opencv':
+            self.face_cascade = cv2.CascadeClassifier(HAAR_CASCADE_PATH)
+
+            # The cascade has an OpenCL path; it's taken when it's handed a UMat
+            self.use_opencl = cv2.ocl.haveOpenCL()
+            cv2.ocl.setUseOpenCL(self.use_opencl)
+            if self.use_opencl:
+                print("Emotion: Running face detection on OpenCL.")
+        self.session = None
+        self.keras_model = None
+
+        # Reused input tensor so classify_batch() doesn't allocate every tick
+        self._batch = np.empty((MAX_BATCH, FACE_SIZE, FACE_SIZE, 1), dtype=np.float32)
+
+        gpu_providers, cpu_providers = [], []
+        if ort is not None:
+            session_options = ort.SessionOptions()
+            if num_threads:
+                session_options.intra_op_num_threads = num_threads
+                session_options.inter_op_num_threads = 1
+
+            available = ort.get_available_providers()
+            gpu_providers = [p for p in GPU_PROVIDERS if (p[0] if isinstance(p, tuple) else p) in available]
+            cpu_providers = [p for p in CPU_PROVIDERS if p in available]
+
+        if gpu_providers and os.path.exists(FP32_MODEL_PATH):
+            # The int8 model's integer ops don't run on TensorRT, so the GPU gets the FP32 export
+            self.session = ort.InferenceSession(FP32_MODEL_PATH, sess_options=session_options,
+                                                providers=gpu_providers + ['CPUExecutionProvider'])
+            self.input_name = self.session.get_inputs()[0].name
+            print(f"Emotion: Using ONNX model on {self.session.get_providers()[0]}.")
+        elif ort is not None and os.path.exists(ONNX_MODEL_PATH):
+            self.session = ort.InferenceSession(ONNX_MODEL_PATH, sess_options=session_options, providers=cpu_providers)
+            self.input_name = self.session.get_inputs()[0].name
+            print(f"Emotion: Using int8 ONNX model on {self.session.get_providers()[0]}.")
+        else:
+            if num_threads:
+                limit_tensorflow_threads(num_threads)
+            self.keras_model = load_keras_emotion_model()
+            print("Emotion: Using DeepFace Keras model.")
+
+    def classify(self, face):
+        """
+        Gets the dominant emotion of a single face crop.
+
+        Args:
+            face (np.ndarray): Grayscale or BGR uint8 face crop
+        Returns:
+            str: One of EMOTION_LABELS
+        """
+        return self.classify_batch([face])[0]
+
+    def classify_batch(self, faces):
+        """
+        Classifies several face crops in one forward pass of the model,
+        instead of paying the per-call overhead once per player.
+
+        Args:
+            faces (list): Grayscale or BGR uint8 face crops
+        Returns:
+            list: One label from EMOTION_LABELS per face
+        """
+        if not faces:
+            return []
+
+        if len(faces) > len(self._batch):
+            self._batch = np.empty((len(faces), FACE_SIZE, FACE_SIZE, 1), dtype=np.float32)
+
+        batch = self._batch[:len(faces)]
+        for face, out in zip(faces, batch):
+            preprocess_face(face, out=out)
+
+        if self.session is not None:
+            probs = self.session.run(None, {self.input_name: batch})[0]
+        else:
+            # Calling the model directly skips predict()'s per-call dataset setup,
+            # which costs more than the forward pass itself for two faces
+            probs = np.asarray(self.keras_model(batch, training=False))
+
+        return [EMOTION_LABELS[i] for i in np.argmax(probs, axis=1)]
+
+    def detect(self, frame):
+        """
+        Finds the faces in a frame.
+
+        Args:
+            frame (np.ndarray): Grayscale or BGR uint8 frame
+        Returns:
+            list: [x, y, w, h] int lists, one per face
+        """
+        if self.face_cascade is not None:
+            gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            if self.use_opencl:
+                gray = cv2.UMat(gray)
+            boxes = self.face_cascade.detectMultiScale(gray, scaleFactor=DETECT_SCALE_FACTOR, minNeighbors=5, minSize=MIN_FACE_SIZE)
+            # An empty tuple when nothing was found, otherwise an (N, 4) int array
+            return boxes.tolist() if len(boxes) else []
+
+        if self.face_yunet is not None:
+            height, width = frame.shape[:2]
+            if self.face_yunet.getInputSize() != (width, height):
+                self.face_yunet.setInputSize((width, height))
+                self._yunet_bgr = np.empty((height, width, 3), dtype=np.uint8)
+
+            bgr = frame
+            if frame.ndim == 2:
+                bgr = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR, dst=self._yunet_bgr)
+
+            _, faces = self.face_yunet.detect(bgr)
+            if faces is None:
+                return []
+            # Boxes can hang off the frame edge; clamp so the crops stay valid
+            boxes = faces[:, :4].astype(np.int32)
+            np.maximum(boxes[:, :2], 0, out=boxes[:, :2])
+            return boxes.tolist()
+
+        from deepface import DeepFace
+
+        # DeepFace's detectors expect 3 channels; the crops are taken from the original
+        detect_frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR) if frame.ndim == 2 else frame
+        faces = DeepFace.extract_faces(
+            img_path=detect_frame,
+            detector_backend=self.detector_backend,
+            enforce_detection=False
+        )
+        boxes = []
+        for face in faces:
+            area = face['facial_area']
+            boxes.append([area['x'], area['y'], area['w'], area['h']])
+        return boxes
+
+    def analyze(self, frame):
+        """
+        Detects faces and classifies them all in a single batch.
+
+        Args:
+            frame (np.ndarray): Grayscale or BGR uint8 frame
+        Returns:
+            list: One dict per face, shaped like DeepFace.analyze's results:
+                  {'region': {'x', 'y', 'w', 'h'}, 'dominant_emotion': str}
+        """
+        regions, crops = [], []
+        for x, y, w, h in self.detect(frame):
+            crop = frame[y:y + h, x:x + w]
+            if crop.size == 0:
+                continue
+
+            regions.append({'x': x, 'y': y, 'w': w, 'h': h})
+            crops.append(crop)
+
+        emotions = self.classify_batch(crops)
+        return [{'region': region, 'dominant_emotion': emotion} for region, emotion in zip(regions, emotions)]
@@ -0,0 +1,69 @@
+"""
+One-time export of DeepFace's emotion model to an int8 ONNX file.
+
+Run this once (on the Pi or a faster machine, then copy src/models/ over):
+    pip install tf2onnx onnxruntime
+    python3 export_emotion_model.py [calibration_dir]
+
+With a calibration_dir of face crops (any size, grayscale or colour), the
+activations are quantized too (static int8), which is what lets the Pi's
+NEON int8 kernels run the whole network. Without one, only the weights are
+quantized (dynamic int8).
+
+emotion.py picks up models/emotion_int8.onnx automatically when it exists.
+On a machine with an NVIDIA GPU (onnxruntime-gpu), it runs models/emotion_fp32.onnx
+through TensorRT in FP16 instead.
+"""
+import os
+import sys
+
+import cv2
+import tensorflow as tf
+import tf2onnx
+from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                      quantize_dynamic, quantize_static)
+
+from emotion import (FACE_SIZE, FP32_MODEL_PATH, MODEL_DIR, ONNX_MODEL_PATH,
+                     load_keras_emotion_model, preprocess_face)
+
+
+class FaceCalibrationReader(CalibrationDataReader):
+    """Feeds the face crops in a directory to the quantizer, one at a time."""
+    def __init__(self, image_dir):
+        paths = sorted(os.path.join(image_dir, f) for f in os.listdir(image_dir))
+        faces = (cv2.imread(path, cv2.IMREAD_GRAYSCALE) for path in paths)
+        self.batches = iter([{"input": preprocess_face(face)[None]} for face in faces if face is not None])
+
+    def get_next(self):
+        return next(self.batches, None)
+
+
+def export_emotion_model(calibration_dir=None):
+    """
+    Converts the Keras emotion model to ONNX, then quantizes it to int8.
+
+    Args:
+        calibration_dir (str): Optional directory of face crops for static quantization
+    """
+    os.makedirs(MODEL_DIR, exist_ok=True)
+
+    print("Loading DeepFace emotion model...")
+    model = load_keras_emotion_model()
+
+    # Leave the batch dimension open so both players can go through in one call
+    input_spec = (tf.TensorSpec((None, FACE_SIZE, FACE_SIZE, 1), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(model, input_signature=input_spec, output_path=FP32_MODEL_PATH)
+    print(f"Saved FP32 model to {FP32_MODEL_PATH}")
+
+    if calibration_dir:
+        quantize_static(FP32_MODEL_PATH, ONNX_MODEL_PATH, FaceCalibrationReader(calibration_dir),
+                        quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+        print(f"Saved static int8 model to {ONNX_MODEL_PATH}")
+    else:
+        quantize_dynamic(FP32_MODEL_PATH, ONNX_MODEL_PATH, weight_type=QuantType.QInt8)
+        print(f"Saved int8 model to {ONNX_MODEL_PATH}")
+
+
+if __name__ == "__main__":
+    export_emotion_model(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -1,33 +1,58 @@
 import cv2
 import numpy as np
+import os
 import time
 import threading
+import multiprocessing as mp
+from multiprocessing.shared_memory import SharedMemory
 
 # --- Import Your Project Modules ---
 try:
-    from picamera2 import Picamera2
-    from deepface import DeepFace
+    from picamera2 import MappedArray, Picamera2
     from audio import Speaker
+    from emotion import YUNET_MODEL_PATH, EmotionAnalyzer
     from roaster import RoastMaster
 except ImportError as e:
     print(f"FATAL ERROR: Failed to import a module. {e}")
     print("Please ensure all files are in src/ and requirements.txt is installed.")
     exit()
 
-# --- Threading & Shared Data ---
-data_lock = threading.Lock()
-latest_frame = None
-player_1_emotion = "unknown"
-player_2_emotion = "unknown"
-player_1_box = None
-player_2_box = None
-app_running = True  # A flag to tell the thread to stop
+# --- Multiprocessing & Shared Data ---
+# The analysis runs in its own process so it never competes with the video
+# feed for the GIL. Frames go to it through shared memory, results come back
+# through a pipe as (player 1 emotion, player 1 box, player 2 emotion, player 2 box).
+# "spawn" because forking a process that already has camera and audio threads is unsafe.
+mp_context = mp.get_context("spawn")
+NO_PLAYERS = ("unknown", None, "unknown", None)
 
 # --- SETTINGS ---
-ANALYSIS_INTERVAL = 0.5  # Run analysis every 0.5 seconds
+ANALYSIS_INTERVAL = 0.5  # Longest the analysis process waits for a new frame
 CAMERA_WIDTH = 1280
 CAMERA_HEIGHT = 720
 CENTER_LINE = CAMERA_WIDTH / 2
+CAMERA_BUFFER_COUNT = 2  # One being filled, one being read; more only adds display lag
+
+# Faces are large in a 2-player setup, so detect on a half-size frame.
+# The camera ISP produces it for us as a grayscale (Y plane) "lores" stream.
+ANALYSIS_SCALE = 0.5
+ANALYSIS_WIDTH = int(CAMERA_WIDTH * ANALYSIS_SCALE)
+ANALYSIS_HEIGHT = int(CAMERA_HEIGHT * ANALYSIS_SCALE)
+# YuNet is a small CNN, more accurate than the Haar cascade at similar speed.
+# Both are much faster than 'mtcnn' on the Pi.
+DETECTOR_BACKEND = 'yunet' if os.path.exists(YUNET_MODEL_PATH) else 'opencv'
+EMOTION_REMAP = {'fear': 'angry'}  # Raging players often read as scared
+
+# Frames that barely differ from the last analyzed one are skipped. Compared
+# on a tiny thumbnail; the threshold is the largest change in any one cell
+# (0-255), so a frown on a player who keeps still still counts.
+SCENE_THUMB_SIZE = (32, 32)
+SCENE_CHANGE_THRESHOLD = 8
+SCENE_MAX_AGE = 1.0  # Seconds; a result older than this is refreshed even if nothing moved
+
+# The Pi 5 has 4 cores. Split them so the video loop (plus the camera and
+# audio threads) and the analysis process never fight over the same ones.
+MAIN_CORES = {0, 1}
+ANALYSIS_CORES = {2, 3}
 
 # --- Define Cooldown Variables ---
 ROAST_COOLDOWN = 10.0  # 10 seconds before a new roast
@@ -42,111 +67,222 @@ BOX_COLOR = (0, 255, 0)      # Green
 LINE_TYPE = 2
 
 # ===================================================================
-# This function runs in the background thread
+# CPU partitioning
 # ===================================================================
-def analysis_worker():
+def pin_to_cores(cores):
     """
-    This worker thread handles the slow DeepFace analysis in the background
-    so the main video feed never lags.
+    Restricts the calling process (and the threads it starts afterwards)
+    to the given cores. Skipped where unsupported or with too few cores.
     """
-    global latest_frame, data_lock, app_running
-    global player_1_emotion, player_2_emotion, player_1_box, player_2_box
+    if not hasattr(os, "sched_setaffinity") or max(cores) >= (os.cpu_count() or 1):
+        return
+    try:
+        os.sched_setaffinity(0, cores)
+    except OSError as e:
+        print(f"WARNING: Could not pin to cores {sorted(cores)}: {e}")
 
-    print("[Analysis Thread] Started.")
+# ===================================================================
+# Model warm-up (runs once at startup)
+# ===================================================================
+def warm_up_models(analyzer):
+    """
+    Runs one throwaway analysis so the emotion model and face detector
+    are loaded before the analysis loop starts. Otherwise the first
+    real frame pays a multi-second cold start.
+    """
+    print("[Analysis Process] Loading emotion models...")
+    try:
+        blank = np.zeros((ANALYSIS_HEIGHT, ANALYSIS_WIDTH), dtype=np.uint8)
+        analyzer.analyze(blank)
+        analyzer.classify(blank)  # In case the detector returned no faces
+        print("[Analysis Process] Emotion models loaded.")
+    except Exception as e:
+        print(f"[Analysis Process] WARNING: Model warm-up failed: {e}")
 
-    while app_running:
-        frame_to_analyze = None
+# ===================================================================
+# HUD layer (re-rendered only when the analysis results change)
+# ===================================================================
+def render_hud(hud, hud_mask, p1_emotion, p1_box, p2_emotion, p2_box):
+    """
+    Draws the player labels and face boxes into the HUD layer.
+
+    The results only change at the analysis rate, so main_app() calls this
+    when they do and blends the same layer onto every camera frame.
+
+    Returns:
+        tuple: (x, y, w, h) of the area the HUD covers
+    """
+    hud[:] = 0
+    cv2.putText(hud, f"P1: {p1_emotion}", (10, 30), FONT, FONT_SCALE, FONT_COLOR, LINE_TYPE)
+    if p1_box:
+        x, y, w, h = p1_box['x'], p1_box['y'], p1_box['w'], p1_box['h']
+        cv2.rectangle(hud, (x, y), (x + w, y + h), BOX_COLOR, 2)
+
+    cv2.putText(hud, f"P2: {p2_emotion}", (int(CENTER_LINE) + 10, 30), FONT, FONT_SCALE, FONT_COLOR, LINE_TYPE)
+    if p2_box:
+        x, y, w, h = p2_box['x'], p2_box['y'], p2_box['w'], p2_box['h']
+        cv2.rectangle(hud, (x, y), (x + w, y + h), BOX_COLOR, 2)
 
-        with data_lock:
-            if latest_frame is not None:
-                frame_to_analyze = latest_frame.copy()
+    np.any(hud, axis=2, out=hud_mask)
+    return cv2.boundingRect(hud_mask.view(np.uint8))
+
+# ===================================================================
+# This function runs in the background process
+# ===================================================================
+def analysis_worker(shm_name, frame_lock, frame_ready, stop_event, results_conn):
+    """
+    This worker process handles the slow emotion analysis in the background
+    so the main video feed never lags.
 
-        if frame_to_analyze is None:
-            time.sleep(ANALYSIS_INTERVAL)  # Wait for first frame
+    Args:
+        shm_name (str): Shared memory block holding the newest grayscale frame
+        frame_lock: Held while the frame in shared memory is written or read
+        frame_ready: Set by the main process when it publishes a new frame
+        stop_event: Set to tell the process to stop
+        results_conn: Pipe end the player results are sent back on
+    """
+    print("[Analysis Process] Started.")
+    pin_to_cores(ANALYSIS_CORES)
+    cv2.setNumThreads(len(ANALYSIS_CORES))
+    shm = SharedMemory(name=shm_name)
+    shared_frame = np.ndarray((ANALYSIS_HEIGHT, ANALYSIS_WIDTH), dtype=np.uint8, buffer=shm.buf)
+    frame_to_analyze = np.empty_like(shared_frame)
+
+    analyzer = EmotionAnalyzer(detector_backend=DETECTOR_BACKEND, num_threads=len(ANALYSIS_CORES))
+    warm_up_models(analyzer)
+
+    last_thumb = None  # Thumbnail of the last frame that was actually analyzed
+    last_analysis = 0.0
+
+    while not stop_event.is_set():
+        # Sleep until the camera publishes a frame we haven't analyzed yet.
+        # Clear before reading, so a frame published in between sets it again.
+        if not frame_ready.wait(timeout=ANALYSIS_INTERVAL):
+            continue
+        frame_ready.clear()
+        with frame_lock:
+            np.copyto(frame_to_analyze, shared_frame)
+
+        # Same scene as last time means the same result, so keep it (for a while)
+        thumb = cv2.resize(frame_to_analyze, SCENE_THUMB_SIZE, interpolation=cv2.INTER_AREA)
+        if (last_thumb is not None
+                and time.monotonic() - last_analysis < SCENE_MAX_AGE
+                and cv2.norm(thumb, last_thumb, cv2.NORM_INF) < SCENE_CHANGE_THRESHOLD):
             continue
 
         try:
-            results = DeepFace.analyze(
-                img_path=frame_to_analyze,
-                actions=['emotion'],
-                enforce_detection=False,
-                silent=True,
-                detector_backend='mtcnn'
-            )
-
-            p1_emotion, p1_box = "unknown", None
-            p2_emotion, p2_box = "unknown", None
-
-            if isinstance(results, list) and len(results) > 0:
-                for face in results:
-                    face_x = face['region']['x']
-                    emotion = face['dominant_emotion']
-
-                    if emotion == "fear":
-                        emotion = "angry"
-
-                    if face_x < CENTER_LINE:
-                        p1_emotion, p1_box = emotion, face['region']
-                    else:
-                        p2_emotion, p2_box = emotion, face['region']
-
-            with data_lock:
-                player_1_emotion = p1_emotion
-                player_2_emotion = p2_emotion
-                player_1_box = p1_box
-                player_2_box = p2_box
+            results = analyzer.analyze(frame_to_analyze)
+            # Only a successful analysis counts, so a failure is retried on the next frame
+            last_thumb = thumb
+            last_analysis = time.monotonic()
+
+            # Index 0 is player 1 (left of CENTER_LINE), index 1 is player 2
+            emotions = ["unknown", "unknown"]
+            boxes = [None, None]
+
+            for face in results:
+                # Scale the region back up to full-frame coordinates
+                region = {k: int(v / ANALYSIS_SCALE) for k, v in face['region'].items()}
+                side = int(region['x'] >= CENTER_LINE)
+                emotion = face['dominant_emotion']
+                emotions[side] = EMOTION_REMAP.get(emotion, emotion)
+                boxes[side] = region
+
+            player_state = (emotions[0], boxes[0], emotions[1], boxes[1])
 
         except Exception as e:
-            with data_lock:
-                player_1_emotion = "unknown"
-                player_2_emotion = "unknown"
-                player_1_box = None
-                player_2_box = None
+            player_state = NO_PLAYERS
 
-        time.sleep(ANALYSIS_INTERVAL)
+        results_conn.send(player_state)
 
-    print("[Analysis Thread] Stopped.")
+    del shared_frame  # Release the view before closing the shared memory
+    shm.close()
+    results_conn.close()
+    print("[Analysis Process] Stopped.")
 
 # ===================================================================
 # This is the Main Thread (Video Feed and App Logic)
 # ===================================================================
 def main_app():
-    global latest_frame, data_lock, app_running
     global player_1_last_roast, player_2_last_roast
 
     print("[Main Thread] Initializing modules...")
+
+    # The per-frame OpenCV calls are too small to be worth a thread pool
+    pin_to_cores(MAIN_CORES)
+    cv2.setNumThreads(1)
+
+    # Initialize our custom hardware/audio classes
+    roaster = RoastMaster()
+    speaker = Speaker()
+
+    # Generate all roast audio in the background while the camera warms up
+    precache_thread = threading.Thread(target=speaker.precache, args=(roaster,), daemon=True)
+    precache_thread.start()
+
     try:
         picam2 = Picamera2()
-        picam2.configure(picam2.create_preview_configuration(main={"format": 'RGB888', "size": (CAMERA_WIDTH, CAMERA_HEIGHT)}))
+        picam2.configure(picam2.create_preview_configuration(
+            # picamera2's RGB888 is stored B, G, R in memory, which is already OpenCV's
+            # channel order, so the frame needs no conversion
+            main={"format": 'RGB888', "size": (CAMERA_WIDTH, CAMERA_HEIGHT)},
+            lores={"format": 'YUV420', "size": (ANALYSIS_WIDTH, ANALYSIS_HEIGHT)},
+            buffer_count=CAMERA_BUFFER_COUNT,
+            queue=False  # Wait for the next frame instead of returning an already-queued one
+        ))
         picam2.start()
         print("[Main Thread] Camera initialized.")
-        time.sleep(1.0)
     except Exception as e:
         print(f"FATAL ERROR: Could not initialize camera: {e}")
         return
 
-    # Initialize our custom hardware/audio classes
-    roaster = RoastMaster()
-    speaker = Speaker()
-
-    analysis_thread = threading.Thread(target=analysis_worker, daemon=True)
-    analysis_thread.start()
+    # The analysis process loads its own models, while the video feed starts
+    shm = SharedMemory(create=True, size=ANALYSIS_WIDTH * ANALYSIS_HEIGHT)
+    shared_frame = np.ndarray((ANALYSIS_HEIGHT, ANALYSIS_WIDTH), dtype=np.uint8, buffer=shm.buf)
+    frame_lock = mp_context.Lock()
+    frame_ready = mp_context.Event()
+    stop_event = mp_context.Event()
+    results_recv, results_send = mp_context.Pipe(duplex=False)
+
+    analysis_process = mp_context.Process(
+        target=analysis_worker,
+        args=(shm.name, frame_lock, frame_ready, stop_event, results_send),
+        daemon=True
+    )
+    analysis_process.start()
+    player_state = NO_PLAYERS
 
     print("[Main Thread] Starting video feed. Press 'q' to quit.")
 
+    # Reused every frame so copying out of the camera buffer doesn't allocate 2.7 MB each time
+    frame_bgr = np.empty((CAMERA_HEIGHT, CAMERA_WIDTH, 3), dtype=np.uint8)
+
+    # The overlay is drawn once per analysis result, not once per frame
+    hud = np.zeros((CAMERA_HEIGHT, CAMERA_WIDTH, 3), dtype=np.uint8)
+    hud_mask = np.zeros((CAMERA_HEIGHT, CAMERA_WIDTH), dtype=bool)
+    hud_key = None
+
     try:
         while True:
             current_time = time.time()
-            frame_rgb = picam2.capture_array()
-
-            with data_lock:
-                latest_frame = frame_rgb.copy()
-
-            frame_bgr = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2BGR)
-
-            with data_lock:
-                p1_emo_copy, p1_box_copy = player_1_emotion, player_1_box
-                p2_emo_copy, p2_box_copy = player_2_emotion, player_2_box
+            # Both streams come from the same request. Read them straight out of the
+            # camera's buffers, which go back to the camera when the request is released.
+            request = picam2.capture_request()
+            try:
+                with MappedArray(request, "main") as main, MappedArray(request, "lores") as lores:
+                    np.copyto(frame_bgr, main.array)
+
+                    # Hand the Y (luma) plane to the analysis process
+                    with frame_lock:
+                        np.copyto(shared_frame, lores.array[:ANALYSIS_HEIGHT, :ANALYSIS_WIDTH])
+                    frame_ready.set()
+            finally:
+                request.release()
+
+            # Keep only the newest result if several arrived since the last frame
+            while results_recv.poll():
+                player_state = results_recv.recv()
+            p1_emo_copy, p1_box_copy, p2_emo_copy, p2_box_copy = player_state
 
             # --- 6. ROASTING LOGIC (FIXED) ---
 
@@ -178,27 +314,33 @@ def main_app():
                 player_2_last_roast = current_time
 
             # --- 7. Draw Overlay on Video Feed (FAST) ---
-            cv2.putText(frame_bgr, f"P1: {p1_emo_copy}", (10, 30), FONT, FONT_SCALE, FONT_COLOR, LINE_TYPE)
-            if p1_box_copy:
-                x, y, w, h = p1_box_copy['x'], p1_box_copy['y'], p1_box_copy['w'], p1_box_copy['h']
-                cv2.rectangle(frame_bgr, (x, y), (x + w, y + h), BOX_COLOR, 2)
+            key = (p1_emo_copy, p1_box_copy, p2_emo_copy, p2_box_copy)
+            if key != hud_key:
+                hud_key = key
+                hx, hy, hw, hh = render_hud(hud, hud_mask, p1_emo_copy, p1_box_copy, p2_emo_copy, p2_box_copy)
 
-            cv2.putText(frame_bgr, f"P2: {p2_emo_copy}", (int(CENTER_LINE) + 10, 30), FONT, FONT_SCALE, FONT_COLOR, LINE_TYPE)
-            if p2_box_copy:
-                x, y, w, h = p2_box_copy['x'], p2_box_copy['y'], p2_box_copy['w'], p2_box_copy['h']
-                cv2.rectangle(frame_bgr, (x, y), (x + w, y + h), BOX_COLOR, 2)
+            np.copyto(frame_bgr[hy:hy + hh, hx:hx + hw], hud[hy:hy + hh, hx:hx + hw],
+                      where=hud_mask[hy:hy + hh, hx:hx + hw, np.newaxis])
 
             # --- 8. Display the frame (FAST) ---
             cv2.imshow("Rage-O-Meter - Press 'q' to quit", frame_bgr)
 
-            if cv2.waitKey(1) & 0xFF == ord('q'):
+            # capture_request() already paces the loop to the camera, so don't wait here too
+            if cv2.pollKey() & 0xFF == ord('q'):
                 break
 
     finally:
         # --- 9. Clean up ---
         print("[Main Thread] Stopping threads and hardware...")
-        app_running = False  # Signal the analysis thread to stop
-        analysis_thread.join()  # Wait for thread to finish
+        stop_event.set()  # Signal the analysis process to stop
+        frame_ready.set()  # Wake it if it's waiting for a frame
+        analysis_process.join(timeout=5.0)  # Wait for it to finish
+        if analysis_process.is_alive():
+            analysis_process.terminate()  # Still loading its models
+        del shared_frame  # Release the view before freeing the shared memory
+        shm.close()
+        shm.unlink()
+        speaker.close()
         picam2.stop()
         cv2.destroyAllWindows()
         print("[Main Thread] Shutdown complete.")
@@ -1,4 +1,5 @@
 import random
+from collections import deque
 
 # --- Simplified ROASTS dictionary ---
 ROASTS = {
@@ -37,7 +38,19 @@ class RoastMaster:
     """
     def __init__(self):
         print("Audio: RoastMaster Initialized.")
-        pass
+
+        # Every template formatted for every player up front, so get_roast()
+        # never has to call str.format
+        self._roasts = {
+            (emotion_key, player_id): [t.format(player_name=player_name) for t in roast_list]
+            for emotion_key, roast_list in ROASTS.items()
+            for player_id, player_name in PLAYER_NAMES.items()
+        }
+
+        # Shuffled decks dealt from in order, so a roast never repeats
+        # until every other one in its list has been said
+        self._decks = {key: deque() for key in self._roasts}
+        self._last_dealt = {}  # Keeps a refilled deck from opening with the roast just said
 
     def get_roast(self, emotion_key, player_id):
         """
@@ -47,20 +60,30 @@ class RoastMaster:
             emotion_key (str): The emotion or trigger ('angry', 'sad')
             player_id (str): The player to roast ('left', 'right', 'all')
         """
+        if emotion_key not in ROASTS:
+            emotion_key = 'default'
 
-        # 1. Get the player's "name"
-        player_name = PLAYER_NAMES.get(player_id, "you")
+        key = (emotion_key, player_id)
+        deck = self._decks.get(key)
+        if deck is not None:
+            if not deck:
+                roast_list = self._roasts[key]
+                shuffled = random.sample(roast_list, len(roast_list))
+                if len(shuffled) > 1 and shuffled[0] == self._last_dealt.get(key):
+                    swap = random.randrange(1, len(shuffled))
+                    shuffled[0], shuffled[swap] = shuffled[swap], shuffled[0]
+                deck.extend(shuffled)
+            roast = deck.popleft()
+            self._last_dealt[key] = roast
+            return roast
 
-        # 2. Get the list of roasts
-        if emotion_key in ROASTS:
-            roast_list = ROASTS[emotion_key]
-        else:
-            roast_list = ROASTS['default']
+        # Unknown player: format on the fly with the generic name
+        return random.choice(ROASTS[emotion_key]).format(player_name="you")
 
-        # 3. Pick a random template
-        roast_template = random.choice(roast_list)
-        
-        # 4. Format the template with the player's name and return it
-        final_roast = roast_template.format(player_name=player_name)
-        
-        return final_roast
\ No newline at end of file
+    def all_roasts(self):
+        """
+        Lists every distinct roast get_roast() can return, across all
+        emotions and players. Used to pre-generate the audio.
+        """
+        # Read from the same table get_roast() deals from, so the two can't drift apart
+        return list(dict.fromkeys(roast for roast_list in self._roasts.values() for roast in roast_list))
\ No newline at end of file
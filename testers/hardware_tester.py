@@ -1,3 +1,4 @@
+import threading
 import time
 from Pi5Neo import Pi5Neo
 from mpu6050 import mpu6050
@@ -7,6 +8,8 @@ LED_COUNT = 12       # 12 LEDs in the ring
 LED_BRIGHTNESS = 128 # 0-255, where 128 = 50% brightness (KEEP AT OR BELOW 128!)
 GYRO_ADDRESS = 0x68  # Default I2C address for MPU-6050
 SHAKE_THRESHOLD = 15 # !! TUNE THIS VALUE !!
+GYRO_SAMPLE_INTERVAL = 0.01 # Sensor is read at 100 Hz in the background
+GYRO_PRINT_INTERVAL = 0.1   # Readings are printed 10 times per second
 
 def test_led():
     """Tests the NeoPixel LED ring."""
@@ -49,6 +52,41 @@ def test_led():
         print("Make sure SPI is enabled: sudo raspi-config -> Interface Options -> SPI")
         print("Is the NeoPixel ring wired correctly?")
 
+def wait_until(stop_event, deadline):
+    """
+    Waits until the time.monotonic() `deadline`, or until stop_event is set.
+    Loops schedule each tick from the previous deadline rather than sleeping
+    a fixed time after their work, so I/O jitter doesn't add up as drift.
+
+    Returns:
+        The deadline waited for, or now if it had already passed, so an
+        overrunning loop restarts its schedule instead of bursting to catch up.
+    """
+    now = time.monotonic()
+    if deadline < now:
+        return now
+    # wait() instead of sleep() so shutdown doesn't wait out the interval
+    stop_event.wait(deadline - now)
+    return deadline
+
+def gyro_reader(sensor, latest, stop_event):
+    """
+    Background thread: keeps latest[0] set to the newest (x, y, z) reading,
+    so slow consumers (printing, the LED ring's SPI writes) never stall I2C.
+    """
+    deadline = time.monotonic()
+    while not stop_event.is_set():
+        try:
+            accel_data = sensor.get_accel_data()
+            # Rebinding one list slot is atomic, so readers need no lock
+            latest[0] = (accel_data['x'], accel_data['y'], accel_data['z'])
+        except Exception as e:
+            print(f"Error reading sensor: {e}")
+            stop_event.wait(1)
+            deadline = time.monotonic()
+            continue
+        deadline = wait_until(stop_event, deadline + GYRO_SAMPLE_INTERVAL)
+
 def test_gyro():
     """Tests the Gyroscope sensor."""
     print("\n--- TESTING GYRO ---")
@@ -64,30 +102,32 @@ def test_gyro():
         return
 
     print("Reading data... Try shaking the sensor.")
-    while True:
-        try:
-            # Get acceleration data
-            accel_data = sensor.get_accel_data()
-            
-            ax = accel_data['x']
-            ay = accel_data['y']
-            az = accel_data['z']
+    latest = [None]
+    stop_event = threading.Event()
+    reader = threading.Thread(target=gyro_reader, args=(sensor, latest, stop_event), daemon=True)
+    reader.start()
+
+    deadline = time.monotonic()
+    try:
+        while not stop_event.is_set():
+            deadline = wait_until(stop_event, deadline + GYRO_PRINT_INTERVAL)
+            if latest[0] is None:
+                continue
+            ax, ay, az = latest[0]
             
             # Print all axes
             print(f"X: {ax:.2f}, Y: {ay:.2f}, Z: {az:.2f}")
 
             # Check for a "shake"
-            if abs(az) > SHAKE_THRESHOLD or abs(ax) > SHAKE_THRESHOLD or abs(ay) > SHAKE_THRESHOLD:
-                print(f"!!! SHAKE DETECTED !!! (Value: {max(abs(ax), abs(ay), abs(az)):.2f})")
-                
-            time.sleep(0.1) # Check 10 times per second
+            peak = max(abs(ax), abs(ay), abs(az))
+            if peak > SHAKE_THRESHOLD:
+                print(f"!!! SHAKE DETECTED !!! (Value: {peak:.2f})")
             
-        except KeyboardInterrupt:
-            print("\nStopping gyro test.")
-            break
-        except Exception as e:
-            print(f"Error reading sensor: {e}")
-            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\nStopping gyro test.")
+    finally:
+        stop_event.set()
+        reader.join()
 
 # --- This makes the script runnable ---
 if __name__ == "__main__":
@@ -8,8 +8,9 @@ import threading  # We import the threading module
 # --- Threading & Shared Data ---
 # These variables will be shared between the main (video) thread
 # and the (AI) worker thread.
-data_lock = threading.Lock()
-latest_frame = None
+data_lock = threading.Lock()  # Guards the player_* results
+latest_frame = None  # Swapped by reference (atomic), so it needs no lock
+frame_ready = threading.Event()  # Set when latest_frame changes
 player_1_emotion = "unknown"
 player_2_emotion = "unknown"
 player_1_race = "unknown"
@@ -24,6 +25,18 @@ ANALYSIS_INTERVAL = 0.5  # Run analysis every 0.5 seconds
 CAMERA_WIDTH = 1280
 CAMERA_HEIGHT = 720
 CENTER_LINE = CAMERA_WIDTH / 2
+CAMERA_BUFFER_COUNT = 2  # One being filled, one being read; more only adds display lag
+# Faces are large in a 2-player setup, so analyze a half-size frame.
+# The camera ISP produces it for us as a YUV420 "lores" stream.
+ANALYSIS_SCALE = 0.5
+ANALYSIS_WIDTH = int(CAMERA_WIDTH * ANALYSIS_SCALE)
+ANALYSIS_HEIGHT = int(CAMERA_HEIGHT * ANALYSIS_SCALE)
+# Skip DeepFace when the scene has barely changed since the last analysis.
+# Same gate as main.py: the threshold is the largest change in any one
+# thumbnail cell (0-255), so a frown on a player who keeps still still counts.
+SCENE_THUMB_SIZE = (32, 32)
+SCENE_CHANGE_THRESHOLD = 8
+SCENE_MAX_AGE = 1.0  # Seconds; a result older than this is refreshed even if nothing moved
 
 # --- FONT & BOX for drawing ---
 FONT = cv2.FONT_HERSHEY_SIMPLEX
@@ -32,6 +45,33 @@ FONT_COLOR = (255, 255, 255)  # White
 BOX_COLOR = (0, 255, 0)      # Green
 LINE_TYPE = 2
 
+# ===================================================================
+# DeepFace call shared by the warm-up and the worker
+# ===================================================================
+def analyze_frame(frame):
+    return DeepFace.analyze(
+        img_path=frame,
+        actions=['emotion', 'race'],
+        enforce_detection=False,
+        silent=True,
+        # --- TRY THESE FOR ACCURACY vs SPEED ---
+        # detector_backend = 'ssd'  # Faster, less accurate
+        detector_backend = 'mtcnn' # Slower, MUCH more accurate
+        # detector_backend = 'opencv' # Default
+    )
+
+def warm_up_models():
+    """
+    Runs one throwaway analysis so DeepFace builds the detector, emotion and
+    race models once, up front. They stay cached for every later call.
+    """
+    print("Loading DeepFace models...")
+    try:
+        analyze_frame(np.zeros((ANALYSIS_HEIGHT, ANALYSIS_WIDTH, 3), dtype=np.uint8))
+        print("DeepFace models loaded.")
+    except Exception as e:
+        print(f"WARNING: Model warm-up failed: {e}")
+
 # ===================================================================
 # This function runs in the background thread
 # ===================================================================
@@ -40,32 +80,35 @@ def analysis_worker():
     global player_1_emotion, player_2_emotion, player_1_race, player_2_race, player_1_box, player_2_box
 
     print("Analysis thread started.")
+    last_thumb = None  # Thumbnail of the last frame DeepFace actually saw
+    last_analysis = 0.0
     
     while app_running:
-        frame_to_analyze = None
-        
-        # 1. Safely get a copy of the latest frame
-        with data_lock:
-            if latest_frame is not None:
-                frame_to_analyze = latest_frame.copy()
-
-        if frame_to_analyze is None:
-            time.sleep(ANALYSIS_INTERVAL)
+        # 1. Wait for a new frame (the main thread replaces it, never edits it)
+        if not frame_ready.wait(timeout=ANALYSIS_INTERVAL):
+            continue
+        frame_ready.clear()
+        frame_to_analyze = latest_frame
+
+        # The Y plane at the top of the YUV frame is already grayscale
+        thumb = cv2.resize(frame_to_analyze[:ANALYSIS_HEIGHT, :ANALYSIS_WIDTH], SCENE_THUMB_SIZE,
+                           interpolation=cv2.INTER_AREA)
+        if (last_thumb is not None
+                and time.monotonic() - last_analysis < SCENE_MAX_AGE
+                and cv2.norm(thumb, last_thumb, cv2.NORM_INF) < SCENE_CHANGE_THRESHOLD):
             continue
+
+        # DeepFace's race model needs colour, so expand the small YUV frame to BGR
+        frame_to_analyze = cv2.cvtColor(frame_to_analyze[:ANALYSIS_HEIGHT * 3 // 2, :ANALYSIS_WIDTH],
+                                        cv2.COLOR_YUV2BGR_I420)
             
         # 2. Run the HEAVY analysis (this is the slow part)
         try:
-            # OPTIMIZATION: DeepFace prefers RGB, so we give it the RGB frame
-            results = DeepFace.analyze(
-                img_path=frame_to_analyze,
-                actions=['emotion', 'race'],
-                enforce_detection=False,
-                silent=True,
-                # --- TRY THESE FOR ACCURACY vs SPEED ---
-                # detector_backend = 'ssd'  # Faster, less accurate
-                detector_backend = 'mtcnn' # Slower, MUCH more accurate
-                # detector_backend = 'opencv' # Default
-            )
+            # DeepFace expects OpenCV's BGR order, which is what the conversion above produced
+            results = analyze_frame(frame_to_analyze)
+            # Only a successful analysis counts, so a failure is retried on the next frame
+            last_thumb = thumb
+            last_analysis = time.monotonic()
             
             # --- Reset values ---
             p1_emotion, p1_race, p1_box = "unknown", "unknown", None
@@ -73,7 +116,9 @@ def analysis_worker():
 
             if isinstance(results, list) and len(results) > 0:
                 for face in results:
-                    face_x = face['region']['x']
+                    # Scale the region back up to full-frame coordinates
+                    region = {k: int(face['region'][k] / ANALYSIS_SCALE) for k in ('x', 'y', 'w', 'h')}
+                    face_x = region['x']
                     emotion = face['dominant_emotion']
                     race = face['dominant_race']
                     
@@ -82,9 +127,9 @@ def analysis_worker():
                         emotion = "angry"  # Use ONE '='
 
                     if face_x < CENTER_LINE:
-                        p1_emotion, p1_race, p1_box = emotion, race, face['region']
+                        p1_emotion, p1_race, p1_box = emotion, race, region
                     else:
-                        p2_emotion, p2_race, p2_box = emotion, race, face['region']
+                        p2_emotion, p2_race, p2_box = emotion, race, region
             
             # 3. Safely update the global variables
             with data_lock:
@@ -109,28 +154,43 @@ if __name__ == "__main__":
     try:
         # -- Initialize piccam2 --
         picam2 = Picamera2()
-        picam2.configure(picam2.create_preview_configuration(main={"format": 'RGB888', "size": (CAMERA_WIDTH, CAMERA_HEIGHT)}))
+        picam2.configure(picam2.create_preview_configuration(
+            # picamera2's RGB888 is stored B, G, R in memory, which is already OpenCV's
+            # channel order, so the frame needs no conversion
+            main={"format": 'RGB888', "size": (CAMERA_WIDTH, CAMERA_HEIGHT)},
+            lores={"format": 'YUV420', "size": (ANALYSIS_WIDTH, ANALYSIS_HEIGHT)},
+            buffer_count=CAMERA_BUFFER_COUNT,
+            queue=False  # Wait for the next frame instead of returning an already-queued one
+        ))
         picam2.start()
-        print("Camera warming up...")
-        time.sleep(1.0)
     except Exception as e:
         print(f"Error initializing camera: {e}")
         exit()
 
+    # Loading the models takes longer than the camera needs to settle,
+    # so it doubles as the camera warm-up.
+    warm_up_models()
+
     # --- Start the Analysis Thread ---
     analysis_thread = threading.Thread(target=analysis_worker, daemon=True)
     analysis_thread.start()
 
     print("Starting camera feed. Press 'q' to quit.")
 
+    # The overlay only changes when the analysis does, so draw it into its own
+    # layer then and copy that layer onto each frame
+    overlay = np.zeros((CAMERA_HEIGHT, CAMERA_WIDTH, 3), dtype=np.uint8)
+    overlay_mask = np.zeros((CAMERA_HEIGHT, CAMERA_WIDTH), dtype=bool)
+    overlay_key = None
+
     try:
         while True:
-            # 1. Read a frame (FAST)
-            frame_bgr = picam2.capture_array()
+            # 1. Read both streams from the same request (FAST, fresh arrays every call)
+            (frame_bgr, frame_yuv), _ = picam2.capture_arrays(["main", "lores"])
             
-            # 2. Update the shared frame for the worker thread (FAST)
-            with data_lock:
-                latest_frame = frame_bgr.copy()
+            # 2. Hand only the small frame to the worker thread (FAST, no copy)
+            latest_frame = frame_yuv
+            frame_ready.set()
             
             # 4. Read shared variables (FAST)
             with data_lock:
@@ -139,20 +199,30 @@ if __name__ == "__main__":
                 p2_emo_copy, p2_race_copy, p2_box_copy = player_2_emotion, player_2_race, player_2_box
 
             # 5. Draw player info on the BGR frame (FAST)
-            
-            # --- Draw Player 1 (Left) Info ---
-            cv2.putText(frame_bgr, f"Player 1: {p1_emo_copy} ({p1_race_copy})",
-                        (10, 30), FONT, FONT_SCALE, FONT_COLOR, LINE_TYPE)
-            if p1_box_copy:
-                x, y, w, h = p1_box_copy['x'], p1_box_copy['y'], p1_box_copy['w'], p1_box_copy['h']
-                cv2.rectangle(frame_bgr, (x, y), (x+w, y+h), BOX_COLOR, LINE_TYPE)
-
-            # --- Draw Player 2 (Right) Info ---
-            cv2.putText(frame_bgr, f"Player 2: {p2_emo_copy} ({p2_race_copy})",
-                        (int(CENTER_LINE) + 10, 30), FONT, FONT_SCALE, FONT_COLOR, LINE_TYPE)
-            if p2_box_copy:
-                x, y, w, h = p2_box_copy['x'], p2_box_copy['y'], p2_box_copy['w'], p2_box_copy['h']
-                cv2.rectangle(frame_bgr, (x, y), (x+w, y+h), BOX_COLOR, LINE_TYPE)
+            key = (p1_emo_copy, p1_race_copy, p1_box_copy, p2_emo_copy, p2_race_copy, p2_box_copy)
+            if key != overlay_key:
+                overlay_key = key
+                overlay[:] = 0
+
+                # --- Draw Player 1 (Left) Info ---
+                cv2.putText(overlay, f"Player 1: {p1_emo_copy} ({p1_race_copy})",
+                            (10, 30), FONT, FONT_SCALE, FONT_COLOR, LINE_TYPE)
+                if p1_box_copy:
+                    x, y, w, h = p1_box_copy['x'], p1_box_copy['y'], p1_box_copy['w'], p1_box_copy['h']
+                    cv2.rectangle(overlay, (x, y), (x+w, y+h), BOX_COLOR, LINE_TYPE)
+
+                # --- Draw Player 2 (Right) Info ---
+                cv2.putText(overlay, f"Player 2: {p2_emo_copy} ({p2_race_copy})",
+                            (int(CENTER_LINE) + 10, 30), FONT, FONT_SCALE, FONT_COLOR, LINE_TYPE)
+                if p2_box_copy:
+                    x, y, w, h = p2_box_copy['x'], p2_box_copy['y'], p2_box_copy['w'], p2_box_copy['h']
+                    cv2.rectangle(overlay, (x, y), (x+w, y+h), BOX_COLOR, LINE_TYPE)
+
+                np.any(overlay, axis=2, out=overlay_mask)
+                ox, oy, ow, oh = cv2.boundingRect(overlay_mask.view(np.uint8))
+
+            np.copyto(frame_bgr[oy:oy + oh, ox:ox + ow], overlay[oy:oy + oh, ox:ox + ow],
+                      where=overlay_mask[oy:oy + oh, ox:ox + ow, np.newaxis])
 
             # 6. Display the frame (FAST)
             cv2.imshow("Live Test Feed - Press 'q' to quit", frame_bgr)
@@ -164,6 +234,7 @@ if __name__ == "__main__":
         # Clean up
         print("Stopping threads and camera...")
         app_running = False  # Signal the thread to stop
+        frame_ready.set()  # Wake it if it's waiting for a frame
         analysis_thread.join() # Wait for thread to finish
         picam2.stop()
         cv2.destroyAllWindows()